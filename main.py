@@ -1,14 +1,31 @@
 import argparse
+import asyncio
 import logging
 import csv
-import subprocess
-import time
+import graphlib
+import heapq
+import itertools
+import os
+import shlex
 import threading
-from collections import defaultdict
-import networkx as nx
-import sys
+import time
+from array import array
+from collections import deque
+
+log = logging.getLogger(__name__)
 
 TASKS_PATH = "./tests/tasks/"
+BATCH_SENTINEL = "__task_sched_layer_done__"
+BATCH_FAILED = "__task_sched_task_failed__"
+
+# Tasks and the batched shell are spawned with `os.posix_spawn` directly
+# instead of fork+exec. File descriptors are non-inheritable by default
+# (PEP 446), so nothing leaks into the children but what their file actions
+# `dup2` in place.
+DEVNULL_FILE_ACTIONS = [
+    (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+    (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+]
 
 
 def parse_args() -> argparse.Namespace:
@@ -32,6 +49,25 @@ def parse_args() -> argparse.Namespace:
         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
         help="Set the logging level (default: CRITICAL).",
     )
+    parser.add_argument(
+        "--batched",
+        action="store_true",
+        default=False,
+        help="Feed the tasks to a single long-lived shell instead of spawning each one.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Maximum number of tasks running at once in parallel (default: no limit). "
+        "Ready tasks on the longest remaining path start first. Not available with --serial or --batched.",
+    )
+    parser.add_argument(
+        "--show-output",
+        action="store_true",
+        default=False,
+        help="Let the tasks write to the terminal (default: their output is discarded).",
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -39,75 +75,64 @@ def parse_args() -> argparse.Namespace:
         help="Validate the input task list and output the expected total runtime.",
     )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.jobs is not None:
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1")
+        if args.serial or args.batched:
+            parser.error("--jobs cannot be combined with --serial or --batched")
+    return args
 
 
-def read_tasks(filepath: str) -> dict:
+def read_tasks(filepath: str) -> list:
     """Read a `.csv` file from the given path.
 
     Args:
         filepath (str): path to the file.
 
     Returns:
-        dict: Dictionary with the csv contents.
+        list: The csv rows, as dictionaries. A task's UID is its position in the list.
     """
     with open(filepath, mode="r", newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        logging.debug("Tasks loaded")
-        tasks = list(reader)
-        for i, task in enumerate(tasks):
-            task['UID'] = str(i + 1)
-        return dict((task['UID'], task) for task in tasks)
-
-
-def get_dependencies(task: dict) -> set:
-    """Given a single task row, parse the `dependencies` key and return a set of values.
+        reader = csv.reader(csvfile)
+        header = next(reader, None)
+        if header is None:  # Empty file
+            return []
+        columns = {column: i for i, column in enumerate(header)}
+        name_col = columns["name"]
+        duration_col = columns["duration"]
+        dependencies_col = columns["dependencies"]
+        tasks = []
+        for row in reader:
+            if not row:  # Blank line
+                continue
+            name = row[name_col]
+            duration = row[duration_col]
+            dependencies = row[dependencies_col]
+            tasks.append({
+                "name": name,
+                "duration": duration,
+                "dependencies": dependencies,
+                "UID": len(tasks),
+                "_deps": frozenset(dependencies.split("-")) - {""},
+                "_dur": int(duration),
+                "_path": f"{TASKS_PATH}{name}",
+            })
+        log.debug("Tasks loaded")
+        return tasks
+
+
+def get_dependencies(task: dict) -> frozenset:
+    """Given a single task row, return the set of values parsed from the `dependencies` key
+    when the task was loaded.
 
     Args:
         task (dict): Task
 
     Returns:
-        set: Dependencies
+        frozenset: Dependencies
     """
-    return set(task["dependencies"].split("-"))
-
-
-def get_all_dependencies(tasks: dict) -> set:
-    """Return all dependencies for all tasks in the original list.
-
-    Args:
-        tasks (dict): Tasks
-
-    Returns:
-        set: Dependencies
-    """
-    dependencies = set()
-    for _, task in tasks.items():
-        for resource in get_dependencies(task):
-            dependencies.add(resource)
-    return dependencies
-
-
-def find_faster_by_uid(tasks: dict, tasks_uids: list) -> str:
-    """Find the fastest task in a sub-group of tasks. Returns the task UID.
-
-    Args:
-        tasks (dict): Full list of tasks
-        tasks_uids (list): Subgroup where it looks for
-
-    Returns:
-        str: UID of the fastest task
-    """
-    faster = ""
-    faster_duration = sys.maxsize
-    for uid in tasks_uids:
-        task = tasks[uid]
-        if task:
-            current = min(faster_duration, int(task["duration"]))
-            if current < faster_duration:
-                faster_duration = current
-                faster = uid
-    return faster
+    return task["_deps"]
 
 
 def is_mono_dependent(task: dict) -> bool:
@@ -122,301 +147,675 @@ def is_mono_dependent(task: dict) -> bool:
     return len(get_dependencies(task)) == 1
 
 
-def dependency_graph(tasks: dict) -> defaultdict:
+def dependency_graph(tasks: list) -> list:
     """Build up an optimized dependency graph. It may create cycled graphs, though.
 
     Args:
-        tasks (dict): Tasks
+        tasks (list): Tasks
 
     Returns:
-        defaultdict: Dependency Graph
+        list: Dependency Graph, the distinct UIDs each task depends on, by UID
     """
-    dependency_graph = defaultdict(set)
+    dependency_graph = [[] for _ in tasks]
     interested_parties = {}
+    fastest_mono = {}  # Fastest mono-dependent task by resource, as (duration, UID)
 
-    for uid, task in tasks.items():
+    for uid, task in enumerate(tasks):
+        mono_dependent = is_mono_dependent(task)
         for dependency in get_dependencies(task):
-            if dependency not in interested_parties:
-                interested_parties[dependency] = [str(uid)]
-            else:
-                interested_parties[dependency].append(str(uid))
-
-    logging.debug("Interested parties by dependency: ")
-    for dep, task in interested_parties.items():
-        logging.debug(f" {dep} : {task}")
-
-    for uid, task in tasks.items():
+            interested_parties.setdefault(dependency, []).append(uid)
+            if mono_dependent:
+                fastest = fastest_mono.get(dependency)
+                if fastest is None or task["_dur"] < fastest[0]:
+                    fastest_mono[dependency] = (task["_dur"], uid)
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Interested parties by dependency: ")
+        for dep, uids in interested_parties.items():
+            log.debug(" %s : %s", dep, uids)
+
+    # Tasks sharing several dependencies meet in more than one bucket:
+    # added_to[writer] holds the last UID the writer was added to, so each
+    # list stays free of duplicates without hashing every edge.
+    added_to = [-1] * len(tasks)
+    for uid, task in enumerate(tasks):
+        added_to[uid] = uid
+        writers_of_uid = dependency_graph[uid]
         for dependency in get_dependencies(task):
-            writers = interested_parties.get(dependency)
-            for writer in writers:
-                if writer != uid:
-                    dependency_graph[uid].add(writer)
-
-    dependencies = get_all_dependencies(tasks)
+            for writer in interested_parties[dependency]:
+                if added_to[writer] != uid:
+                    added_to[writer] = uid
+                    writers_of_uid.append(writer)
 
     # Removing faster and less dependent tasks from dependency_graph
     # it turns them into starters candidates.
-    for resource in dependencies:
-        monodependents = []
-        for task_uid in interested_parties[resource]:
-            if is_mono_dependent(tasks[task_uid]):
-                monodependents.append(task_uid)
-        removal_candidate = find_faster_by_uid(tasks, monodependents)
-        if removal_candidate in dependency_graph:
-            del dependency_graph[removal_candidate]
-
-    logging.debug("Task Dependencies: ")
-    for task, deps in dependency_graph.items():
-        logging.debug(f"    {task} depends on: {', '.join(deps)}")
+    for _, removal_candidate in fastest_mono.values():
+        dependency_graph[removal_candidate] = []
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Task Dependencies: ")
+        for task, deps in enumerate(dependency_graph):
+            if deps:
+                log.debug("    %s depends on: %s", task, ", ".join(map(str, deps)))
 
     return dependency_graph
 
 
 ## If cycles are found in the dependency graph
 ## remove them by doing the dependent tasks one by one
-def dependency_cycled_graph(tasks: dict) -> defaultdict:
+def dependency_cycled_graph(tasks: list) -> list:
     """In case the preferred dependency_graph function had created
     a cycled graph, this function is an option to avoid the cycles.
     It will manage to run all dependent tasks in order, reducing the
     performance
 
     Args:
-        tasks (dict): Tasks
+        tasks (list): Tasks
 
     Returns:
-        defaultdict: Dependency Graph
+        list: Dependency Graph, the distinct UIDs each task depends on, by UID
     """
-    logging.debug("Generating alternative dependency graph")
-    dependency_graph = defaultdict(set)
+    log.debug("Generating alternative dependency graph")
+    dependency_graph = [[] for _ in tasks]
     previous_writer = {}
 
-    for uid, task in tasks.items():
+    # Single pass: each task waits for the previous writer of each of its
+    # dependencies, then becomes the previous writer itself.
+    for uid, task in enumerate(tasks):
         for dependency in get_dependencies(task):
-            if dependency not in previous_writer:
-                previous_writer[dependency] = uid
+            writer = previous_writer.get(dependency)
+            # A task has a handful of dependencies, a linear check is enough
+            if writer is not None and writer not in dependency_graph[uid]:
+                dependency_graph[uid].append(writer)
+            previous_writer[dependency] = uid
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Last tasks by dependency: ")
+        for k, v in previous_writer.items():
+            log.debug(" %s : %s", k, v)
+        log.debug("Task Dependencies: ")
+        for task, deps in enumerate(dependency_graph):
+            if deps:
+                log.debug("    %s depends on: %s", task, ", ".join(map(str, deps)))
 
-    logging.debug("Primary tasks by dependency: ")
-    for k, v in previous_writer.items():
-        logging.debug(f" {k} : {v}")
+    return dependency_graph
 
-    for uid, task in tasks.items():
-        for dependency in get_dependencies(task):
-            writer = previous_writer.get(dependency)
-            if writer and writer != uid:
-                dependency_graph[uid].add(writer)
-                previous_writer[dependency] = uid
 
-    logging.debug("Task Dependencies: ")
-    for task, deps in dependency_graph.items():
-        logging.debug(f"    {task} depends on: {', '.join(deps)}")
+def spawn(task: dict, show_output: bool = False) -> int:
+    """Start the task's command with `os.posix_spawn`, without waiting for it
 
-    return dependency_graph
+    Args:
+        task (dict): Task
+        show_output (bool, optional): Let the task write to our stdout/stderr. Defaults to False.
+
+    Returns:
+        int: PID of the child
+    """
+    path = task["_path"]
+    file_actions = [] if show_output else DEVNULL_FILE_ACTIONS
+    return os.posix_spawn(path, [path], os.environ, file_actions=file_actions)
 
 
-def run_cmd(
-    command: str, ready_events: list = None, done_event: threading.Event = None
-):
-    """Check if the dependencies are ready, run the command, finally mark it as done
+def log_exit(task: dict, returncode: int):
+    """Log the outcome of a finished task
 
     Args:
-        command (str): Command
-        ready_events (list, optional): Dependency list. Defaults to None.
-        done_event (threading.Event, optional): Done flag. Defaults to None.
+        task (dict): Task
+        returncode (int): Exit code of the task's command
+    """
+    if returncode == 0:
+        log.debug("Task %s executed successfully", task["name"])
+    else:
+        log.error("Task %s failed", task["name"])
+
+
+def run_cmd(task: dict, show_output: bool = False):
+    """Spawn the task's command and wait for it to finish
+
+    Args:
+        task (dict): Task
+        show_output (bool, optional): Let the task write to our stdout/stderr. Defaults to False.
+    """
+    try:
+        pid = spawn(task, show_output)
+    except OSError as error:
+        log.error("Task %s failed: %s", task["name"], error)
+        return
+    _, status = os.waitpid(pid, 0)
+    log_exit(task, os.waitstatus_to_exitcode(status))
+
+
+async def run_cmd_async(task: dict, show_output: bool = False):
+    """Spawn the task's command and wait for it to finish without blocking the
+    event loop
+
+    Args:
+        task (dict): Task
+        show_output (bool, optional): Let the task write to our stdout/stderr. Defaults to False.
     """
-    if ready_events:
-        for ev in ready_events:
-            ev.wait()
     try:
-        subprocess.run([f"{TASKS_PATH}{command}"])
-        logging.debug(f"Task {command} executed successfully")
-    except subprocess.CalledProcessError:
-        logging.error(f"Task {command} failed")
-    if done_event:
-        done_event.set()
+        pid = spawn(task, show_output)
+    except OSError as error:
+        log.error("Task %s failed: %s", task["name"], error)
+        return
+    log_exit(task, await wait_for_exit(pid))
+
+
+async def wait_for_exit(pid: int) -> int:
+    """Wait for a child to exit. On Linux its pidfd is watched by the event
+    loop's own selector, so every child is reaped by the single dispatcher
+    thread. Without pidfd support, or once file descriptors run out, the child
+    gets a waiting thread of its own.
+
+    Args:
+        pid (int): PID of the child
+
+    Returns:
+        int: Exit code of the child
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):  # No pidfd support, or EMFILE
+        return await wait_in_thread(pid)
+
+    exited = loop.create_future()
+
+    def on_exit():
+        loop.remove_reader(pidfd)
+        exited.set_result(None)
+
+    loop.add_reader(pidfd, on_exit)  # The pidfd turns readable once the child exits
+    try:
+        await exited
+    finally:
+        os.close(pidfd)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+def wait_in_thread(pid: int) -> asyncio.Future:
+    """Run a blocking `waitpid` in a dedicated thread. Unlike a pooled executor,
+    it never queues behind other long-running children, and it needs no file
+    descriptor.
+
+    Args:
+        pid (int): PID of the child
+
+    Returns:
+        asyncio.Future: Resolves to the exit code of the child
+    """
+    loop = asyncio.get_running_loop()
+    exited = loop.create_future()
+
+    def wait():
+        try:
+            _, status = os.waitpid(pid, 0)
+        except OSError as error:
+            loop.call_soon_threadsafe(exited.set_exception, error)
+        else:
+            code = os.waitstatus_to_exitcode(status)
+            loop.call_soon_threadsafe(exited.set_result, code)
 
+    threading.Thread(target=wait, daemon=True).start()
+    return exited
 
-def check_cycles(tasks: dict, dependencies: defaultdict) -> bool:
+
+def analyze(tasks: list, serial: bool) -> tuple:
+    """Compute, once, everything a run needs: the cycle-free dependency graph,
+    the bottom level of each task (its dispatch priority) and the expected
+    runtime, which in parallel is the highest bottom level.
+
+    Args:
+        tasks (list): Tasks
+        serial (bool): Should it run serial?
+
+    Returns:
+        tuple: Dependency Graph, bottom levels by UID (both None in serial), and expected duration
+    """
+    if serial:
+        return None, None, expected_runtime(tasks)
+    dependencies = schedule(tasks)
+    order = topological_order(dependencies)
+    priorities = bottom_levels(tasks, dependencies, order)
+    return dependencies, priorities, max(priorities, default=0)
+
+
+def schedule(tasks: list) -> list:
+    """Build the dependency graph, falling back to the cycle-free dependency
+    graph if the optimized one has cycles. Meant to be called once per run,
+    and the result passed down.
+
+    Args:
+        tasks (list): Tasks
+
+    Returns:
+        list: Cycle-free Dependency Graph
+    """
+    dependencies = dependency_graph(tasks)  # Try the optimized dependency builder
+    if check_cycles(dependencies):
+        dependencies = dependency_cycled_graph(
+            tasks
+        )  # Use the sub-optimal, if finds cycles in dependency graph
+    return dependencies
+
+
+def check_cycles(dependencies: list) -> bool:
     """Check if the Dependency Graph is a cycled graph.
 
     Args:
-        tasks (dict): Tasks
-        dependencies (defaultdict): Dependency Graph
+        dependencies (list): Dependency Graph
 
     Returns:
         bool: Is a cycled Graph?
     """
-    try:
-        build_DiGraph(tasks, dependencies)
+    if not has_cycle(dependencies):
         return False
-    except nx.NetworkXUnfeasible:
-        logging.critical(
-            "Cycles detected. Running alternative dependency builder. Expect impact in performance"
-        )
-        return True
+    log.critical(
+        "Cycles detected. Running alternative dependency builder. Expect impact in performance"
+    )
+    return True
+
+
+def has_cycle(dependencies: list) -> bool:
+    """Look for a cycle with an iterative depth-first search, marking each task
+    as unvisited, in progress (on the current path) or finished. Stops at the
+    first dependency found in progress, so sorting the graph is never needed.
+
+    Args:
+        dependencies (list): Dependency Graph
+
+    Returns:
+        bool: Is a cycled Graph?
+    """
+    UNVISITED, IN_PROGRESS, FINISHED = 0, 1, 2
+    state = [UNVISITED] * len(dependencies)
+
+    for root in range(len(dependencies)):
+        if state[root] != UNVISITED:
+            continue
+        state[root] = IN_PROGRESS
+        stack = [(root, iter(dependencies[root]))]
+        while stack:
+            uid, deps = stack[-1]
+            for dep in deps:
+                if state[dep] == IN_PROGRESS:
+                    return True
+                if state[dep] == UNVISITED:
+                    state[dep] = IN_PROGRESS
+                    stack.append((dep, iter(dependencies[dep])))
+                    break
+            else:
+                state[uid] = FINISHED
+                stack.pop()
 
+    return False
 
-def run_taks(tasks: dict, serial: bool):
+
+def run_taks(
+    tasks: list,
+    serial: bool,
+    plan: tuple = None,
+    batched: bool = False,
+    jobs: int = None,
+    show_output: bool = False,
+):
     """Run all Tasks in serial or parallel
 
     Args:
-        tasks (dict): Tasks
+        tasks (list): Tasks
         serial (bool): Should it run serial?
+        plan (tuple, optional): Result of `analyze`. Defaults to None (analyzed here).
+        batched (bool, optional): Should it run through a single shell? Defaults to False.
+        jobs (int, optional): Maximum number of parallel tasks. Defaults to None (no limit).
+        show_output (bool, optional): Let the tasks write to our stdout/stderr. Defaults to False.
     """
+    if plan is None:
+        plan = analyze(tasks, serial)
+    dependencies, priorities, expected = plan
+
     start = time.time()
-    if serial:
-        logging.info("Serial execution")
-        run_serial(tasks)
+    if batched:
+        log.info("Batched %s execution", "serial" if serial else "parallel")
+        run_batched(tasks, serial, dependencies, show_output)
+    elif serial:
+        log.info("Serial execution")
+        run_serial(tasks, show_output)
     else:
-        logging.info("Parallel execution")
-        run_parallel(tasks)
+        log.info("Parallel execution")
+        run_parallel(tasks, dependencies, priorities, jobs, show_output)
 
     end = time.time()
     duration = end - start
-    expected = expected_runtime(tasks, serial)
-    logging.info("All tasks executed successfully")
-    logging.info(f"Execution duration time: {duration}")
-    logging.info(f"Expected duration time: {expected}")
-    logging.info(
-        f"Difference between execution and expected time: {duration - expected}"
-    )
-
-
-def run_parallel(tasks: dict):
+    log.info("All tasks executed successfully")
+    log.info("Execution duration time: %s", duration)
+    log.info("Expected duration time: %s", expected)
+    log.info("Difference between execution and expected time: %s", duration - expected)
+
+
+def run_parallel(
+    tasks: list,
+    dependencies: list,
+    priorities: list = None,
+    jobs: int = None,
+    show_output: bool = False,
+):
     """Run all tasks in parallel
 
     Args:
-        tasks (dict): Tasks
+        tasks (list): Tasks
+        dependencies (list): Cycle-free Dependency Graph
+        priorities (list, optional): Bottom levels by UID. Defaults to None (computed here).
+        jobs (int, optional): Maximum number of tasks running at once. Defaults to None (no limit).
+        show_output (bool, optional): Let the tasks write to our stdout/stderr. Defaults to False.
     """
-    dependencies = dependency_graph(tasks)  # Try the optimized dependency builder
-    if check_cycles(tasks, dependencies):
-        dependencies = dependency_cycled_graph(
-            tasks
-        )  # Use the sub-optimal, if finds cycles in dependency graph
-    task_events = {uid: threading.Event() for uid, task in tasks.items()}
-    threads = []
+    if priorities is None:
+        priorities = bottom_levels(tasks, dependencies)
+    asyncio.run(dispatch(tasks, dependencies, priorities, jobs, show_output))
 
-    for uid, task in tasks.items():
-        name = task["name"]
-        deps = dependencies[uid]
-        ready_events = [task_events[dep] for dep in deps]
-        done_event = task_events[uid]
-        t = threading.Thread(target=run_cmd, args=(name, ready_events, done_event))
-        threads.append(t)
-        t.start()
 
-    for t in threads:
-        t.join()
+def build_sorter(dependencies: list) -> graphlib.TopologicalSorter:
+    """Build a prepared TopologicalSorter holding every task and its dependencies.
 
+    Args:
+        dependencies (list): Dependency Graph
+
+    Raises:
+        graphlib.CycleError: If the Dependency Graph is a cycled graph.
+
+    Returns:
+        graphlib.TopologicalSorter: Sorter ready to hand out tasks
+    """
+    sorter = graphlib.TopologicalSorter()
+    for uid, deps in enumerate(dependencies):
+        sorter.add(uid, *deps)
+    sorter.prepare()
+    return sorter
+
+
+async def dispatch(
+    tasks: list,
+    dependencies: list,
+    priorities: list,
+    jobs: int = None,
+    show_output: bool = False,
+):
+    """Start the ready tasks, highest priority first, and release their dependents
+    as soon as they finish: every finished task decrements the in-degree of its
+    dependents, and the ones reaching zero become ready.
 
-def run_serial(tasks: dict):
+    Args:
+        tasks (list): Tasks
+        dependencies (list): Cycle-free Dependency Graph
+        priorities (list): Priority by UID, the higher the sooner
+        jobs (int, optional): Maximum number of tasks running at once. Defaults to None (no limit).
+        show_output (bool, optional): Let the tasks write to our stdout/stderr. Defaults to False.
+    """
+    dependents = get_dependents(dependencies)
+    indegree = [len(deps) for deps in dependencies]
+    arrival = itertools.count()
+    # Heap of (-priority, arrival, uid), ties keep the file order
+    ready = [
+        (-priorities[uid], next(arrival), uid)
+        for uid, degree in enumerate(indegree)
+        if degree == 0
+    ]
+    heapq.heapify(ready)
+    running = {}
+
+    while ready or running:
+        while ready and (jobs is None or len(running) < jobs):
+            _, _, uid = heapq.heappop(ready)
+            command = run_cmd_async(tasks[uid], show_output)
+            running[asyncio.ensure_future(command)] = uid
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            uid = running.pop(future)
+            error = future.exception()
+            if error is not None:
+                # The child may still be running, so its dependents keep waiting
+                log.critical(
+                    "Task %s could not be waited for: %s. Its dependents will not run",
+                    tasks[uid]["name"],
+                    error,
+                )
+                continue
+            for dependent in dependents[uid]:
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    heapq.heappush(
+                        ready, (-priorities[dependent], next(arrival), dependent)
+                    )
+
+
+def run_batched(
+    tasks: list,
+    serial: bool,
+    dependencies: list = None,
+    show_output: bool = False,
+):
+    """Run all tasks through a single long-lived `/bin/sh`, fed over its stdin,
+    so only the shell pays the process-creation cost on the Python side.
+    In parallel, tasks run one dependency layer at a time: the layer is started
+    in background, and the next one is only sent once the shell writes the
+    end-of-layer sentinel. Sentinels and failures go through a separate control
+    pipe, so whatever the tasks print cannot be mistaken for them.
+
+    Args:
+        tasks (list): Tasks
+        serial (bool): Should it run serial?
+        dependencies (list, optional): Cycle-free Dependency Graph, required in parallel. Defaults to None.
+        show_output (bool, optional): Let the tasks write to our stdout/stderr. Defaults to False.
+    """
+    redirect = "" if show_output else " >/dev/null 2>&1"
+    if serial:
+        layers = [[uid] for uid in range(len(tasks))]
+    else:
+        sorter = build_sorter(dependencies)
+        layers = []
+        while sorter.is_active():
+            layer = sorter.get_ready()
+            layers.append(layer)
+            sorter.done(*layer)
+
+    script_read, script_write = os.pipe()
+    control_read, control_write = os.pipe()
+    if control_write == 3:  # A dup2 onto itself would leave it close-on-exec
+        os.set_inheritable(control_write, True)
+    file_actions = [
+        (os.POSIX_SPAWN_DUP2, script_read, 0),
+        (os.POSIX_SPAWN_DUP2, control_write, 3),
+    ]
+    with os.fdopen(script_write, "w") as script, os.fdopen(control_read) as control:
+        try:
+            pid = os.posix_spawn("/bin/sh", ["/bin/sh"], os.environ, file_actions=file_actions)
+        finally:
+            os.close(script_read)
+            os.close(control_write)
+        try:
+            for layer in layers:
+                for uid in layer:
+                    path = shlex.quote(tasks[uid]["_path"])
+                    script.write(
+                        f"{{ {path}{redirect} 3>&- || echo {BATCH_FAILED} {uid} >&3; }} &\n"
+                    )
+                script.write(f"wait\necho {BATCH_SENTINEL} >&3\n")
+                script.flush()
+
+                failed = set()
+                for line in control:
+                    if line == f"{BATCH_SENTINEL}\n":
+                        break
+                    if line.startswith(BATCH_FAILED):
+                        uid = int(line[len(BATCH_FAILED) :])
+                        failed.add(uid)
+                        log.error("Task %s failed", tasks[uid]["name"])
+                else:  # EOF before the sentinel
+                    log.critical("The batched shell exited before the end of its layer")
+                    break
+                if log.isEnabledFor(logging.DEBUG):
+                    for uid in layer:
+                        if uid not in failed:
+                            log.debug("Task %s executed", tasks[uid]["name"])
+        except BrokenPipeError:
+            log.critical("The batched shell exited before reading all the tasks")
+        finally:
+            try:
+                script.close()  # EOF lets the shell exit
+            except BrokenPipeError:  # It is already gone
+                pass
+            os.waitpid(pid, 0)
+
+
+def run_serial(tasks: list, show_output: bool = False):
     """Run all tasks one by one in order
 
     Args:
-        tasks (dict): Tasks
+        tasks (list): Tasks
+        show_output (bool, optional): Let the tasks write to our stdout/stderr. Defaults to False.
     """
-    for uid, task in tasks.items():
-        run_cmd(task["name"])
+    for task in tasks:
+        run_cmd(task, show_output)
 
 
-def get_durations(tasks: dict) -> dict:
-    """Get durations for each task
+def get_dependents(dependencies: list) -> list:
+    """Invert the dependency graph: for each task, the tasks that depend on it.
 
     Args:
-        tasks (dict): Tasks
+        dependencies (list): Dependency Graph
 
     Returns:
-        dict: Dictionary with key=UIDs and values=durations
+        list: Dependents Graph, the list of UIDs depending on each task, by UID
     """
-    return {uid: task["duration"] for uid, task in tasks.items()}
+    dependents = [[] for _ in dependencies]
+    for uid, deps in enumerate(dependencies):
+        for dep in deps:
+            dependents[dep].append(uid)
+    return dependents
 
 
-def build_DiGraph(tasks: dict, dependencies: defaultdict) -> nx.digraph:
-    """Build a DiGraph (Directed graphs with self loops) from the dependencies graph.
+def topological_order(dependencies: list) -> list:
+    """Sort the tasks so that every task comes after all of its dependencies,
+    with Kahn's algorithm. Tasks sitting on a cycle are left out.
 
     Args:
-        tasks (dict): Tasks
-        dependencies (defaultdict): Dependency graph
+        dependencies (list): Dependency Graph
 
     Returns:
-        nx.digraph: directed graph
+        list: UIDs in topological order
     """
-    graph = nx.DiGraph()
-    durations = get_durations(tasks)
+    dependents = get_dependents(dependencies)
+    indegree = [len(deps) for deps in dependencies]
+    queue = deque(uid for uid, degree in enumerate(indegree) if degree == 0)
+    order = []
 
-    for task, deps in dependencies.items():
-        for dep in deps:
-            graph.add_edge(dep, task)
+    while queue:
+        uid = queue.popleft()
+        order.append(uid)
+        for dependent in dependents[uid]:
+            indegree[dependent] -= 1
+            if indegree[dependent] == 0:
+                queue.append(dependent)
+
+    return order
+
+
+def longest_paths(tasks: list, before: list, order: list) -> array:
+    """Find, for each task, the most time consuming path ending on it. `order`
+    must list every task after all of its `before` tasks, so each path is final
+    by the time it is read.
+
+    Args:
+        tasks (list): Tasks
+        before (list): Tasks that come before each task, by UID
+        order (list): UIDs, each one after its `before` tasks
 
-    for uid, task in tasks.items():
-        if uid not in list(nx.topological_sort(graph)):
-            graph.add_node(uid)
+    Returns:
+        array: Duration of the longest path by UID
+    """
+    # Flatten the graph into integer arrays indexed by UID: the `before` tasks
+    # of task i are flat[offsets[i]:offsets[i + 1]].
+    flat = array("q")
+    offsets = array("q", [0])
+    for previous in before:
+        flat.extend(previous)
+        offsets.append(len(flat))
+    lengths = array("q", (task["_dur"] for task in tasks))
 
-    nx.set_node_attributes(graph, durations, "duration")
-    return graph
+    return path_lengths(flat, offsets, lengths, array("q", order))
 
 
-def critical_path(tasks: dict) -> int:
-    """Find the critical path (the most time consuming path in the directed graph)
-    and return the duration
+def path_lengths(flat: array, offsets: array, lengths: array, order: array) -> array:
+    """Longest path recurrence over the flattened graph built by `longest_paths`.
+    Kept to plain integer arrays and indexes, so it can be handed as is to a
+    compiled kernel.
 
     Args:
-        tasks (dict): Tasks
+        flat (array): UIDs of the tasks coming before each task, concatenated
+        offsets (array): Where each task's slice of `flat` starts, plus the end
+        lengths (array): Integer durations by UID
+        order (array): UIDs, each one after the tasks coming before it
 
     Returns:
-        int: Duration
+        array: Duration of the longest path ending on each task, by UID
     """
-    dependencies = dependency_graph(tasks)
-    if check_cycles(tasks, dependencies):
-        dependencies = dependency_cycled_graph(tasks)
-    graph = build_DiGraph(tasks, dependencies)
-    longest_paths = {}
-    durations = get_durations(tasks)
-
-    # Plot dependency graph
-    # import matplotlib.pyplot as plt
-    # nx.draw(graph, with_labels=True, node_size=2000, arrows=True)
-    # plt.show()
-
-    for node in nx.topological_sort(graph):
-        predecessors = list(graph.predecessors(node))
-        if not predecessors:
-            longest_paths[node] = int(durations[node])
-        else:
-            longest_paths[node] = max(longest_paths[p] for p in predecessors) + int(
-                durations[node]
-            )
+    paths = array("q", lengths)
+    for i in order:
+        longest = 0
+        for k in range(offsets[i], offsets[i + 1]):
+            if paths[flat[k]] > longest:
+                longest = paths[flat[k]]
+        paths[i] += longest
+    return paths
 
-    return max(longest_paths.values())
 
+def bottom_levels(tasks: list, dependencies: list, order: list = None) -> array:
+    """Find the bottom level of each task: the most time consuming path from the
+    task (included) to the end of the run.
+
+    Args:
+        tasks (list): Tasks
+        dependencies (list): Cycle-free Dependency Graph
+        order (list, optional): Topological order. Defaults to None (sorted here).
+
+    Returns:
+        array: Bottom level by UID
+    """
+    if order is None:
+        order = topological_order(dependencies)
+    return longest_paths(tasks, get_dependents(dependencies), order[::-1])
 
-def expected_runtime(tasks: dict, serial: bool) -> int:
-    """Return the expected time for running all the tasks
+
+def expected_runtime(tasks: list) -> int:
+    """Return the expected time for running all the tasks one by one
 
     Args:
-        tasks (dict): Tasks
-        serial (bool): Should it run serial?
+        tasks (list): Tasks
 
     Returns:
         int: Duration
     """
-    if serial:
-        expected_time = 0
-        for uid, task in tasks.items():
-            expected_time += int(task["duration"])
-        return expected_time
-    else:
-        return critical_path(tasks)
+    return sum(task["_dur"] for task in tasks)
 
 
 if __name__ == "__main__":
     args = parse_args()
 
-    logger = logging.getLogger()
-    logger.setLevel(args.log_level)
+    logging.basicConfig(level=args.log_level)
+    # Short-circuit every level below the requested one before a record is built
+    logging.disable(getattr(logging, args.log_level) - 10)
 
     tasks = read_tasks(args.file)
+    plan = analyze(tasks, args.serial)
 
     if args.dry_run:
-        print(f"Expected duration time: {expected_runtime(tasks, args.serial)} ")
+        print(f"Expected duration time: {plan[2]} ")
     else:
-        run_taks(tasks, args.serial)
+        run_taks(
+            tasks,
+            args.serial,
+            plan,
+            args.batched,
+            args.jobs,
+            args.show_output,
+        )